@@ -0,0 +1,109 @@
+"""
+Measures how many concurrent retrieval queries one worker process can sustain.
+
+Runs the embed-and-search step of `rag_query_pdf` N times at once on a single
+event loop, two ways:
+
+  blocking  the previous step: a sync handler calling the blocking clients
+            (and a new QdrantClient) inline on the loop, as ctx.step.run did,
+            so concurrent queries run one after another
+  async     the current step: aembed_texts + a shared AsyncQdrantStorage
+
+For each concurrency level it prints throughput and p50/p95 latency, then the
+highest level each mode served within the p95 target. Needs the same
+GEMINI_API_KEY / QDRANT_URL as the app.
+
+    uv run python bench_query.py --concurrency 1 8 32 128 --p95-target 2.0
+"""
+import time
+import asyncio
+import argparse
+import statistics
+from dotenv import load_dotenv
+
+from data_loader import embed_texts, aembed_texts
+from vector_db import QdrantStorage, AsyncQdrantStorage
+
+load_dotenv()
+
+
+def _sync_search(question: str, top_k: int):
+    query_vec = embed_texts([question])[0]
+    return QdrantStorage().search(query_vec, top_k)
+
+
+async def _blocking_step(question: str, top_k: int):
+    # No await inside: like the old sync step handler, this holds the loop until done
+    return _sync_search(question, top_k)
+
+
+async def _async_search(store: AsyncQdrantStorage, question: str, top_k: int):
+    query_vec = (await aembed_texts([question]))[0]
+    return await store.search(query_vec, top_k)
+
+
+async def _timed(coro, submitted: float):
+    # Measured from submission, so time spent queued behind a blocking step counts
+    await coro
+    return time.perf_counter() - submitted
+
+
+async def run_level(mode: str, concurrency: int, question: str, top_k: int, store: AsyncQdrantStorage):
+    start = time.perf_counter()
+    if mode == "blocking":
+        tasks = [_timed(_blocking_step(question, top_k), start) for _ in range(concurrency)]
+    else:
+        tasks = [_timed(_async_search(store, question, top_k), start) for _ in range(concurrency)]
+
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    wall = time.perf_counter() - start
+
+    latencies = sorted(r for r in results if isinstance(r, float))
+    errors = len(results) - len(latencies)
+    if not latencies:
+        return {"mode": mode, "concurrency": concurrency, "qps": 0.0, "p50": 0.0, "p95": 0.0, "errors": errors}
+    return {
+        "mode": mode,
+        "concurrency": concurrency,
+        "qps": len(latencies) / wall,
+        "p50": statistics.median(latencies),
+        "p95": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+        "errors": errors,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32, 128])
+    parser.add_argument("--question", default="What does the document say about pricing?")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--p95-target", type=float, default=2.0, help="p95 latency budget in seconds")
+    args = parser.parse_args()
+
+    store = await AsyncQdrantStorage.create()
+    # Warm up both paths so connection setup isn't counted
+    await _blocking_step(args.question, args.top_k)
+    await _async_search(store, args.question, args.top_k)
+
+    # Highest level reached before the first one that misses the target
+    sustained = {"blocking": 0, "async": 0}
+    missed = set()
+    print(f"{'mode':<9} {'conc':>5} {'qps':>8} {'p50 s':>8} {'p95 s':>8} {'errors':>7}")
+    for concurrency in sorted(args.concurrency):
+        for mode in ("blocking", "async"):
+            r = await run_level(mode, concurrency, args.question, args.top_k, store)
+            print(f"{r['mode']:<9} {r['concurrency']:>5} {r['qps']:>8.1f} {r['p50']:>8.3f} {r['p95']:>8.3f} {r['errors']:>7}")
+            if r["errors"] or r["p95"] > args.p95_target:
+                missed.add(mode)
+            elif mode not in missed:
+                sustained[mode] = concurrency
+
+    print(f"\nHighest concurrency with p95 <= {args.p95_target:.2f}s and no errors:")
+    for mode, concurrency in sustained.items():
+        print(f"  {mode:<9} {concurrency or 'none of the tested levels'}")
+
+    await store.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
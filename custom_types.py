@@ -5,8 +5,19 @@ class RAGChunkAndSrc(pydantic.BaseModel):
     source_id: str = None
 
 
+class RAGDedupeResult(pydantic.BaseModel):
+    chunk: list[str]
+    chunk_ids: list[str]
+    fingerprints: list[dict]
+    source_id: str = None
+    total: int
+    links: list[dict] = []
+
+
 class RAGUpsertResult(pydantic.BaseModel):
     ingested: int
+    skipped: int = 0
+    dedupe_ratio: float = 0.0
 
 
 class RAGSearchResult(pydantic.BaseModel):
@@ -37,3 +37,13 @@ def embed_texts(texts: list[str]) -> list[list[float]]:
     )
     # FIXED: The new SDK returns embeddings as a list of objects with a .values attribute
     return [item.values for item in response.embeddings]
+
+
+async def aembed_texts(texts: list[str]) -> list[list[float]]:
+    # Same call through the SDK's async client so it doesn't block the event loop
+    response = await google_client.aio.models.embed_content(
+        model=EMBED_MODEL,
+        contents=texts,
+        config={"task_type": "RETRIEVAL_DOCUMENT"}
+    )
+    return [item.values for item in response.embeddings]
@@ -0,0 +1,190 @@
+import os
+import re
+import uuid
+import difflib
+import hashlib
+
+# Chunk fingerprints so boilerplate (headers, legal footers, repeated
+# appendices) is embedded and stored once instead of once per PDF.
+SIMHASH_BITS = 64
+SIMHASH_MAX_DISTANCE = int(os.getenv("DEDUPE_MAX_DISTANCE", "3"))
+if not 0 <= SIMHASH_MAX_DISTANCE <= 3:
+    raise ValueError(f"DEDUPE_MAX_DISTANCE must be between 0 and 3, got {SIMHASH_MAX_DISTANCE}")
+# Pigeonhole: with max_distance + 1 bands, two hashes within max_distance bits
+# agree exactly on at least one band, so band lookups never miss a candidate.
+# The cap keeps bands at 16+ bits: a 256-chunk lookup batch then matches ~1-2%
+# of stored points by chance, while 12-bit bands would already match ~30%.
+SIMHASH_BANDS = SIMHASH_MAX_DISTANCE + 1
+BAND_BITS = SIMHASH_BITS // SIMHASH_BANDS
+# A SimHash match alone can hide different facts (names, amounts, dates), so
+# near-duplicates are only linked when this few normalized tokens differ.
+MAX_TOKEN_DIFF = int(os.getenv("DEDUPE_MAX_TOKEN_DIFF", "2"))
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def _normalize(text: str) -> str:
+    return " ".join(_TOKEN_RE.findall(text.lower()))
+
+
+def token_diff(a: str, b: str) -> int:
+    """Number of normalized tokens inserted, deleted or replaced between two chunks."""
+    matcher = difflib.SequenceMatcher(None, _normalize(a).split(), _normalize(b).split(), autojunk=False)
+    return sum(
+        (i2 - i1) + (j2 - j1)
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes()
+        if tag != "equal"
+    )
+
+
+def exact_hash(text: str) -> str:
+    """SHA-256 of the whitespace/case/punctuation-normalized chunk."""
+    return hashlib.sha256(_normalize(text).encode("utf-8")).hexdigest()
+
+
+def simhash(text: str) -> int:
+    """64-bit SimHash over word 3-shingles (falls back to single words for short chunks)."""
+    tokens = _normalize(text).split()
+    if len(tokens) >= 3:
+        features = [" ".join(tokens[i : i + 3]) for i in range(len(tokens) - 2)]
+    else:
+        features = tokens
+
+    weights = [0] * SIMHASH_BITS
+    for feature in features:
+        h = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "big")
+        for bit in range(SIMHASH_BITS):
+            weights[bit] += 1 if h >> bit & 1 else -1
+
+    value = 0
+    for bit in range(SIMHASH_BITS):
+        if weights[bit] > 0:
+            value |= 1 << bit
+    return value
+
+
+def _bands(value: int):
+    mask = (1 << BAND_BITS) - 1
+    return [(i, value >> (i * BAND_BITS) & mask) for i in range(SIMHASH_BANDS)]
+
+
+def fingerprint(text: str) -> dict:
+    value = simhash(text)
+    return {
+        "hash": exact_hash(text),
+        # Hex so it survives JSON step outputs and Qdrant's signed 64-bit integers
+        "simhash": f"{value:016x}",
+        "bands": [band_key(band) for band in _bands(value)],
+    }
+
+
+def band_key(band) -> str:
+    # Band width is part of the key so points fingerprinted under a different
+    # DEDUPE_MAX_DISTANCE never produce false candidates.
+    i, value = band
+    return f"{BAND_BITS}:{i}:{value}"
+
+
+class FingerprintIndex:
+    """In-memory fingerprint lookup. The persistent copy lives in the Qdrant
+    payload of each stored chunk, so deleting or wiping points drops it too."""
+
+    def __init__(self):
+        self._by_hash = {}
+        self._by_band = {}
+
+    def add(self, fp: dict, point_id: str, sources: list[str], text: str) -> dict:
+        entry = {
+            "hash": fp["hash"],
+            "simhash": int(fp["simhash"], 16),
+            "point_id": point_id,
+            "sources": list(sources),
+            "text": text,
+        }
+        self._by_hash.setdefault(entry["hash"], entry)
+        for band in _bands(entry["simhash"]):
+            self._by_band.setdefault(band, []).append(entry)
+        return entry
+
+    def lookup(self, fp: dict, text: str):
+        """Returns the entry this chunk duplicates (exactly or nearly), or None.
+
+        SimHash candidates only count when their text is within MAX_TOKEN_DIFF tokens.
+        """
+        if fp["hash"] in self._by_hash:
+            return self._by_hash[fp["hash"]]
+
+        value = int(fp["simhash"], 16)
+        for band in _bands(value):
+            for entry in self._by_band.get(band, []):
+                if bin(entry["simhash"] ^ value).count("1") > SIMHASH_MAX_DISTANCE:
+                    continue
+                if token_diff(entry["text"], text) <= MAX_TOKEN_DIFF:
+                    return entry
+        return None
+
+
+def chunk_point_id(source_id: str, content_hash: str) -> str:
+    # Derived from content, not position, so re-ingesting an edited PDF never
+    # lands a new chunk on the id of an existing one.
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{source_id}:{content_hash}"))
+
+
+def dedupe_chunks(chunks: list[str], fingerprints: list[dict], source_id: str, stored: FingerprintIndex):
+    """
+    Splits chunks into ones that still need embedding and ones that duplicate
+    something already stored or an earlier chunk of the same document.
+    Returns (unique_indices, links).
+    """
+    unique_indices = []
+    links = []
+    seen = FingerprintIndex()  # catches in-document duplicates
+
+    for i, (chunk, fp) in enumerate(zip(chunks, fingerprints)):
+        match = stored.lookup(fp, chunk) or seen.lookup(fp, chunk)
+        if match is not None:
+            links.append({"chunk_index": i, "point_id": match["point_id"], "sources": match["sources"]})
+            continue
+        seen.add(fp, point_id=chunk_point_id(source_id, fp["hash"]), sources=[source_id], text=chunk)
+        unique_indices.append(i)
+
+    return unique_indices, links
+
+
+def link_updates(links: list[dict], source_id: str) -> dict:
+    """
+    Returns {point_id: sources} for stored points that `source_id` now relies
+    on, so the source can be recorded on them and searches credit it.
+    """
+    updates = {}
+    for link in links:
+        sources = updates.get(link["point_id"], link["sources"])
+        if source_id not in sources:
+            updates[link["point_id"]] = sources + [source_id]
+    return updates
+
+
+def detach_source(points: list[dict], source_id: str):
+    """
+    Plans removing `source_id` from points ({"point_id", "sources"}): points
+    no other source relies on are deleted, the rest keep their other sources.
+    Returns (delete_ids, {point_id: remaining_sources}).
+    """
+    delete_ids = []
+    updates = {}
+    for point in points:
+        remaining = [s for s in point["sources"] if s != source_id]
+        if remaining:
+            updates[point["point_id"]] = remaining
+        else:
+            delete_ids.append(point["point_id"])
+    return delete_ids, updates
+
+
+def stale_points(points: list[dict], source_id: str, keep_ids: set[str]):
+    """
+    Plans cleanup when `source_id` is ingested again: its stored points
+    ({"point_id", "sources"}) that the new version neither stores nor links
+    to are detached from it, as in detach_source.
+    """
+    return detach_source([p for p in points if p["point_id"] not in keep_ids], source_id)
@@ -4,12 +4,14 @@ import inngest
 import inngest.fast_api
 from inngest.experimental import ai
 from dotenv import load_dotenv
-import uuid
 import os 
+import asyncio
+import contextlib
 import datetime
-from data_loader import load_and_chunk_pdf, embed_texts
-from vector_db import QdrantStorage
-from custom_types import RAGChunkAndSrc, RAGUpsertResult, RAGSearchResult, RAGQueryResult   
+from data_loader import load_and_chunk_pdf, aembed_texts
+from vector_db import AsyncQdrantStorage
+from dedupe import FingerprintIndex, fingerprint, dedupe_chunks, chunk_point_id, link_updates, stale_points
+from custom_types import RAGChunkAndSrc, RAGDedupeResult, RAGUpsertResult, RAGSearchResult, RAGQueryResult   
 from cerebras.cloud.sdk import Cerebras
 
 
@@ -23,38 +25,110 @@ inngest_client = inngest.Inngest(
     serializer=inngest.PydanticSerializer()
 )
 
+# One async Qdrant client per worker process, shared by every in-flight run
+_store = None
+_store_lock = asyncio.Lock()
+
+async def get_store() -> AsyncQdrantStorage:
+    global _store
+    if _store is not None:
+        return _store
+    async with _store_lock:
+        if _store is None:
+            _store = await AsyncQdrantStorage.create()
+    return _store
+
 @inngest_client.create_function(
     fn_id="RAG: Ingest PDF",
     retries=5,
     trigger=inngest.TriggerEvent(event="rag/ingest_pdf")
 )
 async def rag_ingest_pdf(ctx: inngest.Context):
-    def _load(ctx: inngest.Context) -> RAGChunkAndSrc:
+    # PDF parsing and fingerprinting are CPU-bound, so they run in a worker
+    # thread instead of stalling queries sharing this event loop.
+    async def _load(ctx: inngest.Context) -> RAGChunkAndSrc:
         pdf_path = ctx.event.data["pdf_path"]
         source_id = ctx.event.data.get("source_id", pdf_path)
-        chunks = load_and_chunk_pdf(pdf_path)
+        chunks = await asyncio.to_thread(load_and_chunk_pdf, pdf_path)
         return RAGChunkAndSrc(chunk=chunks, source_id=source_id)
     
 
-    def _upsert(chunks_and_src: RAGChunkAndSrc) -> RAGUpsertResult:
+    async def _dedupe(chunks_and_src: RAGChunkAndSrc) -> RAGDedupeResult:
         chunks = chunks_and_src.chunk
         source_id = chunks_and_src.source_id
+        fingerprints = await asyncio.to_thread(lambda: [fingerprint(c) for c in chunks])
+
+        # Fingerprints live in the Qdrant payload, so only points that still exist can be matched
+        store = await get_store()
+        candidates = await store.find_fingerprints(fingerprints)
+
+        def _match():
+            stored = FingerprintIndex()
+            for entry in candidates:
+                stored.add(entry, point_id=entry["point_id"], sources=entry["sources"], text=entry["text"])
+            return dedupe_chunks(chunks, fingerprints, source_id, stored)
+
+        unique_indices, links = await asyncio.to_thread(_match)
+        chunk_ids = [chunk_point_id(source_id, fingerprints[i]["hash"]) for i in unique_indices]
+
+        # Re-ingesting an edited PDF: drop this source from chunks the new version no longer has
+        keep_ids = set(chunk_ids) | {link["point_id"] for link in links}
+        delete_ids, updates = stale_points(await store.points_for_source(source_id), source_id, keep_ids)
+        await store.set_sources(updates)
+        await store.delete_points(delete_ids)
+
+        return RAGDedupeResult(
+            chunk=[chunks[i] for i in unique_indices],
+            chunk_ids=chunk_ids,
+            fingerprints=[fingerprints[i] for i in unique_indices],
+            source_id=source_id,
+            total=len(chunks),
+            links=links,
+        )
+
+    async def _upsert(deduped: RAGDedupeResult) -> RAGUpsertResult:
+        chunks = deduped.chunk
+        source_id = deduped.source_id
         batch_size = 10
         all_vecs = []
         for i in range(0, len(chunks), batch_size):
             batch = chunks[i : i + batch_size]
-            all_vecs.extend(embed_texts(batch))
-
-        ids = [str(uuid.uuid5(uuid.NAMESPACE_URL, f"{source_id}:{i}")) for i in range(len(chunks))]
-        payloads = [{"source": source_id, "text": chunks[i]} for i in range(len(chunks))]
-
-        QdrantStorage().upsert(ids, all_vecs, payloads)
-        return RAGUpsertResult(ingested=len(chunks))
+            all_vecs.extend(await aembed_texts(batch))
+
+        payloads = [
+            {
+                "source": source_id,
+                "sources": [source_id],
+                "text": chunks[i],
+                "hash": fp["hash"],
+                "simhash": fp["simhash"],
+                "simhash_bands": fp["bands"],
+            }
+            for i, fp in enumerate(deduped.fingerprints)
+        ]
+
+        store = await get_store()
+        if chunks:
+            await store.upsert(deduped.chunk_ids, all_vecs, payloads)
+
+        # Record this document on the stored chunks it was deduplicated against,
+        # so searches credit it and deleting the other document keeps them.
+        await store.set_sources(link_updates(deduped.links, source_id))
+
+        skipped = deduped.total - len(chunks)
+        return RAGUpsertResult(
+            ingested=len(chunks),
+            skipped=skipped,
+            dedupe_ratio=skipped / deduped.total if deduped.total else 0.0,
+        )
 
     
-    chunks_and_src = await ctx.step.run("load-and-chunk", lambda: _load(ctx), output_type=RAGChunkAndSrc)
+    chunks_and_src = await ctx.step.run("load-and-chunk", _load, ctx, output_type=RAGChunkAndSrc)
 
-    ingested = await ctx.step.run("embed-and-upsert", lambda: _upsert(chunks_and_src), output_type=RAGUpsertResult)
+    deduped = await ctx.step.run("dedupe-chunks", _dedupe, chunks_and_src, output_type=RAGDedupeResult)
+    ctx.logger.info(f"{deduped.source_id}: {len(deduped.links)}/{deduped.total} chunks are duplicates")
+
+    ingested = await ctx.step.run("embed-and-upsert", _upsert, deduped, output_type=RAGUpsertResult)
     return ingested.model_dump()
 
 @inngest_client.create_function(
@@ -64,16 +138,16 @@ async def rag_ingest_pdf(ctx: inngest.Context):
 )
 
 async def rag_query_pdf(ctx: inngest.Context):
-    def _search(question: str, top_k: int = 5):
-       query_vec = embed_texts([question])[0]
-       store = QdrantStorage()
-       found = store.search(query_vec, top_k)
+    async def _search(question: str, top_k: int = 5):
+       query_vec = (await aembed_texts([question]))[0]
+       store = await get_store()
+       found = await store.search(query_vec, top_k)
        return RAGSearchResult(contexts=found["contexts"], sources=found["sources"])
 
     question = ctx.event.data["question"]
     top_k = ctx.event.data.get("top_k", 5)
 
-    found = await ctx.step.run("embed-and-search", lambda: _search(question, top_k), output_type=RAGSearchResult)
+    found = await ctx.step.run("embed-and-search", _search, question, top_k, output_type=RAGSearchResult)
 
     context_block = "/n/n".join(found.contexts)
     user_content = (
@@ -104,7 +178,14 @@ async def rag_query_pdf(ctx: inngest.Context):
     return {"answer": answer, "sources": found.sources, "num_contexts": len(found.contexts)}
 
 
-app = FastAPI()
+@contextlib.asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    if _store is not None:
+        await _store.close()
+
+
+app = FastAPI(lifespan=lifespan)
 
 inngest.fast_api.serve(
     app, 
@@ -1,6 +1,5 @@
 import streamlit as st
 import os
-import asyncio
 import time
 from pathlib import Path
 from dotenv import load_dotenv
@@ -335,10 +334,11 @@ def handle_file_upload(uploaded_file, inngest_client):
             file_path.write_bytes(uploaded_file.getbuffer())
             
             if inngest_client:
-                asyncio.run(inngest_client.send(inngest.Event(
+                # send_sync avoids spinning up a fresh event loop for every upload
+                inngest_client.send_sync(inngest.Event(
                     name="rag/ingest_pdf",
                     data={"pdf_path": str(file_path.resolve()), "source_id": uploaded_file.name}
-                )))
+                ))
                 st.session_state.ingested_files.add(file_id)
                 status.update(label="Complete", state="complete")
     except Exception as e:
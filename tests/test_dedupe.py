@@ -0,0 +1,169 @@
+import random
+
+import pytest
+
+from dedupe import (
+    SIMHASH_MAX_DISTANCE,
+    FingerprintIndex,
+    chunk_point_id,
+    dedupe_chunks,
+    detach_source,
+    fingerprint,
+    link_updates,
+    stale_points,
+)
+
+WORDS = [f"word{i}" for i in range(2000)]
+
+
+def make_chunk(seed: int, n: int = 170) -> str:
+    rng = random.Random(seed)
+    return " ".join(rng.choice(WORDS) for _ in range(n))
+
+
+def with_simhash(value: int) -> dict:
+    # Fingerprint with a hand-picked SimHash and a hash nothing else shares
+    return {"hash": f"h{value:x}", "simhash": f"{value:016x}"}
+
+
+def flip_bits(value: int, n: int) -> int:
+    # Spread the flipped bits so several bands are touched
+    if n == 0:
+        return value
+    for bit in range(0, 64, 64 // n)[:n]:
+        value ^= 1 << bit
+    return value
+
+
+def store(chunks: list[str], source_id: str, index: FingerprintIndex) -> list[str]:
+    """Runs dedupe against `index` and records the unique chunks, like a completed upsert."""
+    fps = [fingerprint(c) for c in chunks]
+    unique, _ = dedupe_chunks(chunks, fps, source_id, index)
+    ids = []
+    for i in unique:
+        point_id = chunk_point_id(source_id, fps[i]["hash"])
+        index.add(fps[i], point_id=point_id, sources=[source_id], text=chunks[i])
+        ids.append(point_id)
+    return ids
+
+
+def test_exact_match_after_normalization():
+    index = FingerprintIndex()
+    text = "Confidential.  All rights reserved, Example Corp!"
+    index.add(fingerprint(text), point_id="p1", sources=["a.pdf"], text=text)
+
+    other = "confidential all RIGHTS reserved\nexample corp"
+    match = index.lookup(fingerprint(other), other)
+    assert match is not None and match["point_id"] == "p1"
+
+
+def test_near_duplicate_within_threshold():
+    index = FingerprintIndex()
+    base = 0x0123456789ABCDEF
+    text = make_chunk(1)
+    index.add(with_simhash(base), point_id="p1", sources=["a.pdf"], text=text)
+
+    match = index.lookup(with_simhash(flip_bits(base, SIMHASH_MAX_DISTANCE)), text)
+    assert match is not None and match["point_id"] == "p1"
+
+
+def test_near_miss_just_outside_threshold():
+    index = FingerprintIndex()
+    base = 0x0123456789ABCDEF
+    text = make_chunk(1)
+    index.add(with_simhash(base), point_id="p1", sources=["a.pdf"], text=text)
+
+    assert index.lookup(with_simhash(flip_bits(base, SIMHASH_MAX_DISTANCE + 1)), text) is None
+
+
+def test_near_duplicate_with_different_facts_is_kept():
+    body = make_chunk(1, n=150)
+    a = body + " The agreement with Acme Corp for 5000 dollars is due March 1."
+    b = body + " The agreement with Globex Inc for 9000 dollars is due June 30."
+    index = FingerprintIndex()
+    index.add({"hash": "a", "simhash": "0" * 16}, point_id="p1", sources=["a.pdf"], text=a)
+
+    # Even with identical SimHashes the text check rejects the match
+    assert index.lookup({"hash": "b", "simhash": "0" * 16}, b) is None
+    unique, links = dedupe_chunks([b], [fingerprint(b)], "b.pdf", index)
+    assert unique == [0] and links == []
+
+
+@pytest.mark.skipif(SIMHASH_MAX_DISTANCE < 2, reason="this page number swap flips 2 bits")
+def test_near_duplicate_text_is_linked():
+    chunk = make_chunk(1)
+    stored = chunk + " Page 3"
+    index = FingerprintIndex()
+    index.add(fingerprint(stored), point_id="p1", sources=["a.pdf"], text=stored)
+
+    new = chunk + " Page 7"
+    unique, links = dedupe_chunks([new], [fingerprint(new)], "b.pdf", index)
+    assert unique == []
+    assert links == [{"chunk_index": 0, "point_id": "p1", "sources": ["a.pdf"]}]
+
+
+def test_in_document_duplicates_link_to_first_occurrence():
+    a, b = make_chunk(1), make_chunk(2)
+    chunks = [a, b, a, a.upper()]
+    fps = [fingerprint(c) for c in chunks]
+
+    unique, links = dedupe_chunks(chunks, fps, "doc.pdf", FingerprintIndex())
+
+    first_id = chunk_point_id("doc.pdf", fps[0]["hash"])
+    assert unique == [0, 1]
+    assert [link["chunk_index"] for link in links] == [2, 3]
+    assert all(link["point_id"] == first_id for link in links)
+
+
+def test_reingest_removes_chunks_the_new_version_dropped():
+    a, x, y = make_chunk(1), make_chunk(2), make_chunk(3)
+    index = FingerprintIndex()
+    a_id, x_id = store([a, x], "doc.pdf", index)
+    shared_id = store([make_chunk(4)], "other.pdf", index)[0]
+    points = [
+        {"point_id": a_id, "sources": ["doc.pdf"]},
+        {"point_id": x_id, "sources": ["doc.pdf"]},
+        {"point_id": shared_id, "sources": ["other.pdf", "doc.pdf"]},
+    ]
+
+    chunks = [a, y]
+    fps = [fingerprint(c) for c in chunks]
+    unique, links = dedupe_chunks(chunks, fps, "doc.pdf", index)
+    keep_ids = {chunk_point_id("doc.pdf", fps[i]["hash"]) for i in unique} | {l["point_id"] for l in links}
+
+    delete_ids, updates = stale_points(points, "doc.pdf", keep_ids)
+    assert delete_ids == [x_id]
+    assert updates == {shared_id: ["other.pdf"]}
+
+
+def test_reingest_never_reuses_an_existing_point_id():
+    a, x, y = make_chunk(1), make_chunk(2), make_chunk(3)
+    index = FingerprintIndex()
+    v1_ids = store([a, x], "doc.pdf", index)
+
+    chunks = [a, y, x]
+    fps = [fingerprint(c) for c in chunks]
+    unique, links = dedupe_chunks(chunks, fps, "doc.pdf", index)
+
+    assert unique == [1]
+    assert chunk_point_id("doc.pdf", fps[1]["hash"]) not in v1_ids
+    assert {link["point_id"] for link in links} == set(v1_ids)
+
+
+def test_link_updates_add_the_new_source_once():
+    links = [
+        {"chunk_index": 0, "point_id": "p1", "sources": ["a.pdf"]},
+        {"chunk_index": 3, "point_id": "p1", "sources": ["a.pdf"]},
+        {"chunk_index": 5, "point_id": "p2", "sources": ["b.pdf"]},
+    ]
+    assert link_updates(links, "b.pdf") == {"p1": ["a.pdf", "b.pdf"]}
+
+
+def test_detach_source_keeps_points_other_sources_rely_on():
+    points = [
+        {"point_id": "p1", "sources": ["a.pdf"]},
+        {"point_id": "p2", "sources": ["a.pdf", "b.pdf"]},
+    ]
+    delete_ids, updates = detach_source(points, "a.pdf")
+    assert delete_ids == ["p1"]
+    assert updates == {"p2": ["b.pdf"]}
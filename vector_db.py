@@ -1,6 +1,47 @@
 import os
-from qdrant_client import QdrantClient, models
-from qdrant_client.models import VectorParams, Distance, PointStruct
+from qdrant_client import QdrantClient, AsyncQdrantClient, models
+from qdrant_client.models import VectorParams, Distance, PointStruct, PayloadSchemaType
+from dedupe import detach_source
+
+# Payload fields written by the ingest dedupe step (see dedupe.py)
+FINGERPRINT_FIELDS = ("hash", "simhash_bands", "sources")
+
+
+def _sources(payload: dict) -> list[str]:
+    # "sources" lists every document sharing a deduplicated chunk; points
+    # stored before dedupe only have "source".
+    return payload.get("sources") or [payload.get("source", "")]
+
+
+def _source_filter(source_name: str):
+    return models.Filter(
+        should=[
+            models.FieldCondition(key="source", match=models.MatchValue(value=source_name)),
+            models.FieldCondition(key="sources", match=models.MatchValue(value=source_name)),
+        ]
+    )
+
+
+def _group_by_sources(updates: dict):
+    groups = {}
+    for point_id, sources in updates.items():
+        groups.setdefault(tuple(sources), []).append(point_id)
+    return groups
+
+
+def _to_search_result(results):
+    contexts = []
+    sources = set()
+
+    for r in results:
+        payload = getattr(r, "payload", None) or {}
+        text = payload.get("text", "")
+        if text:
+            contexts.append(text)
+            sources.update(_sources(payload))
+
+    return {"contexts": contexts, "sources": list(sources)}
+
 
 class QdrantStorage:
     def __init__(self, dims=768):
@@ -20,6 +61,12 @@ class QdrantStorage:
                 collection_name=self.collection_name,
                 vectors_config=VectorParams(size=self.dims, distance=Distance.COSINE),
             )
+        # Idempotent; also covers collections created before dedupe existed
+        self._create_fingerprint_indexes()
+
+    def _create_fingerprint_indexes(self):
+        for field in FINGERPRINT_FIELDS:
+            self.client.create_payload_index(self.collection_name, field_name=field, field_schema=PayloadSchemaType.KEYWORD)
 
     def upsert(self, ids, vectors, payloads):
         points = [
@@ -37,34 +84,40 @@ class QdrantStorage:
             with_payload=True
         ).points 
 
-        contexts = []
-        sources = set()
-
-        for r in results:
-            payload = getattr(r, "payload", None) or {}
-            text = payload.get("text", "")
-            source = payload.get("source", "")
-            if text:
-                contexts.append(text)
-                sources.add(source)
-
-        return {"contexts": contexts, "sources": list(sources)}
+        return _to_search_result(results)
     
     def delete_document(self, source_name: str):
-        """Removes all chunks associated with a specific filename."""
-        return self.client.delete(
-            collection_name=self.collection_name,
-            points_selector=models.FilterSelector(
-                filter=models.Filter(
-                    must=[
-                        models.FieldCondition(
-                            key="source", 
-                            match=models.MatchValue(value=source_name)
-                        )
-                    ]
-                )
+        """Removes all chunks associated with a specific filename.
+
+        Chunks other documents were deduplicated against are kept for them.
+        """
+        points = []
+        offset = None
+        while True:
+            batch, offset = self.client.scroll(
+                collection_name=self.collection_name,
+                scroll_filter=_source_filter(source_name),
+                limit=256,
+                offset=offset,
+                with_payload=["source", "sources"],
+                with_vectors=False,
+            )
+            points.extend({"point_id": str(p.id), "sources": _sources(p.payload or {})} for p in batch)
+            if offset is None:
+                break
+
+        delete_ids, updates = detach_source(points, source_name)
+        for sources, ids in _group_by_sources(updates).items():
+            self.client.set_payload(
+                collection_name=self.collection_name,
+                payload={"sources": list(sources), "source": sources[0]},
+                points=ids,
+            )
+        if delete_ids:
+            self.client.delete(
+                collection_name=self.collection_name,
+                points_selector=models.PointIdsList(points=delete_ids),
             )
-        )
     
     def wipe_database(self):
         """Deletes the entire collection and recreates it empty."""
@@ -74,4 +127,120 @@ class QdrantStorage:
         self.client.create_collection(
             collection_name=self.collection_name,
             vectors_config=models.VectorParams(size=self.dims, distance=Distance.COSINE)
-        )
\ No newline at end of file
+        )
+        self._create_fingerprint_indexes()
+
+
+class AsyncQdrantStorage:
+    """Non-blocking twin of QdrantStorage for use inside async Inngest functions.
+
+    Collection setup needs an await, so build instances with `await AsyncQdrantStorage.create()`.
+    """
+
+    def __init__(self, dims=768):
+        url = os.getenv("QDRANT_URL", "http://localhost:6333")
+        api_key = os.getenv("QDRANT_API_KEY")
+
+        self.client = AsyncQdrantClient(url=url, api_key=api_key, timeout=30)
+        self.collection_name = "docs"
+        self.dims = dims
+
+    @classmethod
+    async def create(cls, dims=768):
+        self = cls(dims)
+        if not await self.client.collection_exists(self.collection_name):
+            await self.client.create_collection(
+                collection_name=self.collection_name,
+                vectors_config=VectorParams(size=self.dims, distance=Distance.COSINE),
+            )
+        # Idempotent; also covers collections created before dedupe existed
+        for field in FINGERPRINT_FIELDS:
+            await self.client.create_payload_index(self.collection_name, field_name=field, field_schema=PayloadSchemaType.KEYWORD)
+        return self
+
+    async def upsert(self, ids, vectors, payloads):
+        points = [
+            PointStruct(id=ids[i], vector=vectors[i], payload=payloads[i])
+            for i in range(len(ids))
+        ]
+        await self.client.upsert(self.collection_name, points=points)
+
+    async def search(self, query_vector, top_k: int = 5):
+        response = await self.client.query_points(
+            collection_name=self.collection_name,
+            query=query_vector,
+            limit=top_k,
+            with_payload=True
+        )
+        return _to_search_result(response.points)
+
+    async def find_fingerprints(self, fingerprints: list[dict], batch_size: int = 256):
+        """Returns stored chunks sharing an exact hash or a SimHash band with any of `fingerprints`."""
+        found = {}  # by point id: a point can match more than one batch
+        for i in range(0, len(fingerprints), batch_size):
+            batch = fingerprints[i : i + batch_size]
+            query_filter = models.Filter(
+                should=[
+                    models.FieldCondition(key="hash", match=models.MatchAny(any=[fp["hash"] for fp in batch])),
+                    models.FieldCondition(key="simhash_bands", match=models.MatchAny(any=[b for fp in batch for b in fp["bands"]])),
+                ]
+            )
+            offset = None
+            while True:
+                points, offset = await self.client.scroll(
+                    collection_name=self.collection_name,
+                    scroll_filter=query_filter,
+                    limit=256,
+                    offset=offset,
+                    with_payload=["hash", "simhash", "source", "sources", "text"],
+                    with_vectors=False,
+                )
+                for p in points:
+                    payload = p.payload or {}
+                    found[str(p.id)] = {
+                        "hash": payload["hash"],
+                        "simhash": payload["simhash"],
+                        "point_id": str(p.id),
+                        "sources": _sources(payload),
+                        "text": payload.get("text", ""),
+                    }
+                if offset is None:
+                    break
+        return list(found.values())
+
+    async def points_for_source(self, source_name: str) -> list[dict]:
+        """Returns {"point_id", "sources"} for every point `source_name` relies on."""
+        points = []
+        offset = None
+        while True:
+            batch, offset = await self.client.scroll(
+                collection_name=self.collection_name,
+                scroll_filter=_source_filter(source_name),
+                limit=256,
+                offset=offset,
+                with_payload=["source", "sources"],
+                with_vectors=False,
+            )
+            points.extend({"point_id": str(p.id), "sources": _sources(p.payload or {})} for p in batch)
+            if offset is None:
+                break
+        return points
+
+    async def delete_points(self, ids: list[str]):
+        if ids:
+            await self.client.delete(
+                collection_name=self.collection_name,
+                points_selector=models.PointIdsList(points=ids),
+            )
+
+    async def set_sources(self, updates: dict):
+        """Applies {point_id: sources} from dedupe.link_updates / detach_source."""
+        for sources, ids in _group_by_sources(updates).items():
+            await self.client.set_payload(
+                collection_name=self.collection_name,
+                payload={"sources": list(sources), "source": sources[0]},
+                points=ids,
+            )
+
+    async def close(self):
+        await self.client.close()